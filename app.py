@@ -1,15 +1,26 @@
 import os
 import json
+import re
+import math
+import atexit
+import hashlib
 import sys
-import requests
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
 from dotenv import load_dotenv
-from rapidfuzz import fuzz
+# requests et rapidfuzz sont importés à la première utilisation pour accélérer le démarrage
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                               QHBoxLayout, QTextEdit, QLineEdit, QPushButton, 
                               QLabel, QFrame, QGraphicsDropShadowEffect, QDialog, 
                               QComboBox, QScrollArea, QSpacerItem, QSizePolicy)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QPropertyAnimation, QEasingCurve, QTimer, QPoint
-from PyQt6.QtGui import QFont, QTextCursor, QColor, QPalette, QLinearGradient, QPainter, QBrush
+from PyQt6.QtCore import (Qt, QThread, pyqtSignal, pyqtProperty, QObject, QEvent, QPropertyAnimation,
+                          QAbstractAnimation, QEasingCurve, QTimer, QPoint, QSize)
+from PyQt6.QtGui import (QFont, QTextCursor, QColor, QPalette, QLinearGradient, QPainter, QBrush,
+                         QTextDocument, QAbstractTextDocumentLayout, QAction, QTextCharFormat,
+                         QKeySequence)
 
 load_dotenv()
 api_key = os.getenv("TOGETHER_AI_API_KEY")
@@ -19,81 +30,981 @@ if not api_key:
 
 DOSSIER_DATA = "data"
 FICHIER_BASE = os.path.join(DOSSIER_DATA, "base_connaissances.json")
+FICHIER_RENDUS = os.path.join(DOSSIER_DATA, "rendus.jsonl")
 os.makedirs(DOSSIER_DATA, exist_ok=True)
 
+# === Enregistrement de traces (JYMIE_TRACE=chemin.jsonl pour l'activer) ===
+class EnregistreurTrace:
+    """Journal JSONL des étapes de chaque question : recherche, appels HTTP, sauvegardes.
+
+    Une ligne par événement : {"t": secondes depuis le début, "id": n° de requête,
+    "ev": type, ...}. Les événements émis depuis un thread héritent de l'identifiant
+    de la requête que ce thread traite (voir demarrer_requete).
+    """
+    def __init__(self, chemin=None):
+        self.chemin = chemin
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._fichier = None
+        self._debut = time.perf_counter()
+        self._prochain_id = 0
+
+    @property
+    def actif(self):
+        return bool(self.chemin)
+
+    def nouvel_identifiant(self):
+        with self._lock:
+            self._prochain_id += 1
+            return self._prochain_id
+
+    def demarrer_requete(self, identifiant):
+        """Associe les événements suivants du thread courant à une requête"""
+        self._local.id = identifiant
+
+    def evenement(self, ev, identifiant=None, **champs):
+        if not self.actif:
+            return
+        ligne = {"t": round(time.perf_counter() - self._debut, 6),
+                 "id": identifiant if identifiant is not None else getattr(self._local, "id", None),
+                 "ev": ev}
+        ligne.update(champs)
+        with self._lock:
+            if self._fichier is None:
+                self._fichier = open(self.chemin, "a", encoding="utf-8", buffering=1)
+                self._fichier.write(json.dumps({"t": 0.0, "id": None, "ev": "debut",
+                                                "horodatage": time.time()}, separators=(",", ":")) + "\n")
+            self._fichier.write(json.dumps(ligne, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+trace = EnregistreurTrace(os.getenv("JYMIE_TRACE"))
+
 def verifier_fichier_json():
     if not os.path.exists(FICHIER_BASE):
         with open(FICHIER_BASE, "w", encoding="utf-8") as f:
             json.dump({}, f, ensure_ascii=False, indent=4)
 
-verifier_fichier_json()
-
 def charger_base(fichier=FICHIER_BASE):
     with open(fichier, "r", encoding="utf-8") as f:
         return json.load(f)
 
 def sauvegarder_base(base, fichier=FICHIER_BASE):
+    debut = time.perf_counter()
     with open(fichier, "w", encoding="utf-8") as f:
         json.dump(base, f, ensure_ascii=False, indent=4)
+    if trace.actif:
+        trace.evenement("sauvegarde", fichier=os.path.basename(fichier),
+                        octets=os.path.getsize(fichier), duree=round(time.perf_counter() - debut, 6))
+
+# === Normalisation des clés du cache ===
+# La même chaîne sert à l'insertion et à la recherche : accents, ponctuation,
+# emoji, espaces et "?" final ne créent plus d'entrées séparées.
+NORMALISATION_MOTS_VIDES = os.getenv("JYMIE_MOTS_VIDES", "0") == "1"
+NORMALISATION_RACINES = os.getenv("JYMIE_RACINES", "0") == "1"
+
+MOTS_VIDES = frozenset("""
+    a au aux avec c ce ces cet cette d de des du elle en est et il j je l la le les leur
+    lui m ma me mes moi mon n ne nous on ou par pas pour qu que qui s sa se ses son sur
+    t ta te tes toi ton tu un une vos votre vous y
+""".split())
+
+SUFFIXES_FRANCAIS = ("issements", "issement", "ations", "ation", "ements", "ement",
+                     "ments", "ment", "euses", "euse", "eaux", "aux", "eux", "es", "s", "x", "e")
+
+_RE_NON_MOT = re.compile(r"[^\w\s]+")
+_RE_ESPACES = re.compile(r"\s+")
+
+def _raciner(mot):
+    """Racinisation française légère : retire le suffixe le plus long connu"""
+    for suffixe in SUFFIXES_FRANCAIS:
+        if len(mot) - len(suffixe) >= 3 and mot.endswith(suffixe):
+            return mot[:-len(suffixe)]
+    return mot
+
+@lru_cache(maxsize=4096)
+def normaliser_question(texte, mots_vides=NORMALISATION_MOTS_VIDES, racines=NORMALISATION_RACINES):
+    """Clé de cache canonique d'une question.
+
+    Idempotente : normaliser_question(normaliser_question(x)) == normaliser_question(x),
+    sans quoi migrer_base re-clé la base à chaque démarrage.
+    """
+    decompose = unicodedata.normalize("NFKD", texte.casefold())
+    sans_accents = "".join(c for c in decompose if not unicodedata.combining(c))
+    nettoye = _RE_ESPACES.sub(" ", _RE_NON_MOT.sub(" ", sans_accents).replace("_", " ")).strip()
+    if mots_vides or racines:
+        # Répété jusqu'à stabilité : une racine peut encore perdre un suffixe
+        # ("classes" -> "class" -> "clas") ou devenir un mot vide ("leurs" -> "leur")
+        mots = nettoye.split()
+        while True:
+            suivants = mots
+            if mots_vides:
+                suivants = [m for m in suivants if m not in MOTS_VIDES] or suivants
+            if racines:
+                suivants = [_raciner(m) for m in suivants]
+            if suivants == mots:
+                break
+            mots = suivants
+        nettoye = " ".join(mots)
+    # Une question faite uniquement de symboles garde une clé non vide
+    return nettoye or texte.lower().strip()
+
+def normaliser_lot(textes, mots_vides=NORMALISATION_MOTS_VIDES, racines=NORMALISATION_RACINES):
+    """Normalise une liste de questions (migration, imports en masse)"""
+    return [normaliser_question(t, mots_vides, racines) for t in textes]
+
+def migrer_base(base, mots_vides=NORMALISATION_MOTS_VIDES, racines=NORMALISATION_RACINES):
+    """Re-clé la base avec normaliser_question et fusionne les doublons.
+
+    Renvoie (nouvelle base, modifiée). En cas de collision, la réponse la plus
+    longue est conservée. L'opération est idempotente.
+    """
+    questions = list(base)
+    nouvelle = {}
+    for question, cle in zip(questions, normaliser_lot(questions, mots_vides, racines)):
+        reponse = base[question]
+        if cle not in nouvelle or len(reponse) > len(nouvelle[cle]):
+            nouvelle[cle] = reponse
+    return nouvelle, list(nouvelle) != questions
+
+# Rempli en arrière-plan après le premier affichage (voir charger_connaissances)
+connaissances_locales = {}
+base_chargee = threading.Event()
+# Exception rencontrée à la lecture ; tant qu'elle est définie, la base n'est jamais réécrite
+erreur_base = None
+# Échec d'écriture de la base migrée : la base lue reste utilisable
+erreur_migration = None
+
+def charger_connaissances():
+    """Charge et migre la base de connaissances, puis signale qu'elle est prête"""
+    global erreur_base, erreur_migration
+    try:
+        verifier_fichier_json()
+        base, migree = migrer_base(charger_base())
+        # Utilisable même si la migration ne peut pas être écrite
+        connaissances_locales.update(base)
+        if migree:
+            try:
+                sauvegarder_base(base)
+            except OSError as e:
+                erreur_migration = e
+        # Avant base_chargee : une réponse du cache trouve déjà son rendu
+        # au lieu de le refaire et de l'ajouter une seconde fois au journal
+        try:
+            charger_rendus(connaissances_locales)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # les rendus ne sont qu'un cache : un fichier illisible est ignoré
+    except Exception as e:
+        erreur_base = e
+    finally:
+        base_chargee.set()
+
+# === Rendu des réponses (Markdown -> HTML) ===
+# Les réponses sont analysées une seule fois ; le HTML (corps seul, styles par défaut
+# retirés) est ajouté à data/rendus.jsonl, une ligne {"h": empreinte, "html": ...} par
+# réponse, pour que les réponses du cache ne soient jamais ré-analysées.
+rendus_html = {}
+_verrou_rendus = threading.Lock()
+POLICE_REPONSE = ("Segoe UI", 11)
+# En-tête retiré par compacter_html et rétabli à l'affichage
+ENTETE_HTML = "<html><head><style>p, li { white-space: pre-wrap; }</style></head><body>"
+_RE_CORPS = re.compile(r"<body[^>]*>\n?(.*)</body>", re.S)
+_RE_STYLE_NUL = re.compile(r" ?(?:margin-(?:top|bottom|left|right): ?0px|-qt-block-indent:0|text-indent:0px);")
+_RE_STYLE_VIDE = re.compile(r' style=" *"')
+_RE_PREFIXE = re.compile(r"^(🎯|📴 \(hors ligne\)|💰 \(budget atteint\)|❌) ")
+
+def empreinte(texte):
+    return hashlib.sha1(texte.encode("utf-8")).hexdigest()[:16]
+
+def separer_prefixe(texte):
+    """Sépare le marqueur d'origine ('🎯 ', '📴 (hors ligne) '...) du corps de la réponse"""
+    correspondance = _RE_PREFIXE.match(texte)
+    if correspondance:
+        return correspondance.group(0), texte[correspondance.end():]
+    return "", texte
+
+def compacter_html(html):
+    """Corps HTML de QTextDocument.toHtml() sans l'en-tête ni les styles à zéro"""
+    correspondance = _RE_CORPS.search(html)
+    corps = correspondance.group(1) if correspondance else html
+    return _RE_STYLE_VIDE.sub("", _RE_STYLE_NUL.sub("", corps))
+
+def rendre_html(texte, persister=False):
+    """HTML compact d'une réponse Markdown, depuis le cache si elle a déjà été rendue.
+
+    Avec persister, un nouveau rendu est ajouté au journal data/rendus.jsonl.
+    """
+    cle = empreinte(texte)
+    html = rendus_html.get(cle)
+    if html is not None:
+        return html
+    document = QTextDocument()
+    document.setDefaultFont(QFont(*POLICE_REPONSE))
+    document.setMarkdown(texte)
+    html = compacter_html(document.toHtml())
+    rendus_html[cle] = html
+    if persister:
+        ajouter_rendu(cle, html)
+    return html
+
+def ajouter_rendu(cle, html):
+    """Ajoute un rendu en fin de journal, sans réécrire le fichier"""
+    ligne = json.dumps({"h": cle, "html": html}, ensure_ascii=False, separators=(",", ":")) + "\n"
+    debut = time.perf_counter()
+    with _verrou_rendus:
+        with open(FICHIER_RENDUS, "a", encoding="utf-8") as f:
+            f.write(ligne)
+    trace.evenement("sauvegarde", fichier=os.path.basename(FICHIER_RENDUS),
+                    octets=len(ligne.encode("utf-8")), duree=round(time.perf_counter() - debut, 6))
+
+def charger_rendus(base):
+    """Charge le journal des rendus en ne gardant que ceux d'une réponse de la base.
+
+    Le journal n'est réécrit (compacté) que s'il contient des entrées orphelines
+    (par exemple après une fusion de migrer_base), en double ou illisibles.
+    """
+    if not os.path.exists(FICHIER_RENDUS):
+        return
+    utiles = {empreinte(reponse) for reponse in base.values()}
+    rendus = {}
+    lignes = 0
+    # Lecture et compactage sous le même verrou : aucun ajout ne se perd entre les deux
+    with _verrou_rendus:
+        with open(FICHIER_RENDUS, "r", encoding="utf-8") as f:
+            for ligne in f:
+                lignes += 1
+                try:
+                    entree = json.loads(ligne)
+                except ValueError:
+                    continue  # dernière ligne tronquée par un arrêt brutal
+                if entree["h"] in utiles:
+                    rendus[entree["h"]] = entree["html"]
+        rendus_html.update(rendus)
+        if len(rendus) != lignes:
+            temporaire = FICHIER_RENDUS + ".tmp"
+            with open(temporaire, "w", encoding="utf-8") as f:
+                for cle, html in rendus.items():
+                    f.write(json.dumps({"h": cle, "html": html}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(temporaire, FICHIER_RENDUS)
+
+# Réponses qui ne viennent pas d'un modèle : erreur, repli hors ligne, budget atteint
+PREFIXES_DEGRADES = ("❌", "📴", "💰")
+
+# Bandes de similarité : au-dessus de SEUIL_CONNU la réponse locale est définitive,
+# entre SEUIL_SPECULATIF et SEUIL_CONNU elle est affichée en attendant l'API
+SEUIL_CONNU = int(os.getenv("JYMIE_SEUIL_CONNU", "70"))
+SEUIL_SPECULATIF = int(os.getenv("JYMIE_SEUIL_SPECULATIF", "55"))
+
+def meilleure_correspondance(question, base, seuil=SEUIL_SPECULATIF):
+    """Renvoie (question connue, score) la plus proche au-dessus du seuil, ou (None, 0)"""
+    # Chemin rapide : une clé normalisée identique évite tout calcul de similarité
+    if question in base:
+        return question, 100.0
+    from rapidfuzz import fuzz, process
+    resultat = process.extractOne(question, base.keys(), scorer=fuzz.ratio, score_cutoff=seuil)
+    if resultat is None:
+        return None, 0
+    return resultat[0], resultat[1]
+
+# === Routage multi-modèles ===
+API_URL = os.getenv("JYMIE_API_URL", "https://api.together.ai/v1/chat/completions")
+PROMPT_SYSTEME = "Tu es Jymie, un assistant IA sophistiqué et élégant qui répond toujours en français avec style et précision."
+FICHIER_MODELES = os.path.join(DOSSIER_DATA, "modeles.json")
+
+MODELES_PAR_DEFAUT = {
+    "rapide": {
+        "model": "mistralai/Mistral-7B-Instruct-v0.3",
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "max_tokens": 256,
+        "timeout": 15,
+        "cout_1k_tokens": 0.0002
+    },
+    "complet": {
+        "model": "mistralai/Mixtral-8x7B-Instruct-v0.1",
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "max_tokens": 512,
+        "timeout": 30,
+        "cout_1k_tokens": 0.0006
+    }
+}
+
+CHAINES_PAR_DEFAUT = {
+    "simple": ["rapide", "complet"],
+    "complexe": ["complet", "rapide"]
+}
+
+MOTS_COMPLEXES = ("pourquoi", "explique", "expliquer", "compare", "comparer", "analyse",
+                  "code", "programme", "démontre", "démontrer", "détaille", "rédige")
+
+def charger_config_modeles(fichier=FICHIER_MODELES):
+    """Charge la configuration des modèles (data/modeles.json optionnel)"""
+    config = {
+        "modeles": {nom: dict(profil) for nom, profil in MODELES_PAR_DEFAUT.items()},
+        "chaines": {cle: list(chaine) for cle, chaine in CHAINES_PAR_DEFAUT.items()},
+        "seuil_mots_simple": 12,
+        "seuil_hors_ligne": 50
+    }
+    if fichier and os.path.exists(fichier):
+        with open(fichier, "r", encoding="utf-8") as f:
+            perso = json.load(f)
+        for nom, profil in perso.get("modeles", {}).items():
+            config["modeles"].setdefault(nom, {}).update(profil)
+        config["chaines"].update(perso.get("chaines", {}))
+        for cle in ("seuil_mots_simple", "seuil_hors_ligne"):
+            if cle in perso:
+                config[cle] = perso[cle]
+    return config
+
+def classer_question(question, seuil_mots=12):
+    """Heuristique bon marché : 'simple' ou 'complexe'"""
+    texte = question.lower()
+    if "\n" in texte or "```" in texte:
+        return "complexe"
+    if len(texte.split()) > seuil_mots:
+        return "complexe"
+    if any(mot in texte for mot in MOTS_COMPLEXES):
+        return "complexe"
+    return "simple"
+
+class StatistiquesModeles:
+    """Latence, taux d'échec et coût observés par modèle.
+
+    Le taux d'échecs récents décroît aussi avec le temps (demi-vie en secondes) :
+    un modèle relégué après un incident passager revient en tête de chaîne
+    même si plus personne ne l'appelle entre-temps.
+    """
+    def __init__(self, alpha=0.3, demi_vie=60.0):
+        self.alpha = alpha
+        self.demi_vie = demi_vie
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _entree(self, nom):
+        entree = self._stats.setdefault(nom, {
+            "latence": None, "appels": 0, "echecs": 0, "echecs_recents": 0.0, "cout": 0.0,
+            "mise_a_jour": time.monotonic()
+        })
+        self._vieillir(entree)
+        return entree
+
+    def _vieillir(self, entree):
+        maintenant = time.monotonic()
+        ecoule = maintenant - entree["mise_a_jour"]
+        if ecoule > 0:
+            entree["echecs_recents"] *= 0.5 ** (ecoule / self.demi_vie)
+            entree["mise_a_jour"] = maintenant
+
+    def enregistrer_succes(self, nom, latence, cout=0.0):
+        with self._lock:
+            entree = self._entree(nom)
+            if entree["latence"] is None:
+                entree["latence"] = latence
+            else:
+                entree["latence"] += self.alpha * (latence - entree["latence"])
+            entree["appels"] += 1
+            entree["echecs_recents"] *= 1 - self.alpha
+            entree["cout"] += cout
+
+    def enregistrer_echec(self, nom):
+        with self._lock:
+            entree = self._entree(nom)
+            entree["appels"] += 1
+            entree["echecs"] += 1
+            entree["echecs_recents"] += self.alpha * (1 - entree["echecs_recents"])
+
+    def en_difficulte(self, nom, seuil=0.5):
+        """Vrai si le modèle échoue trop souvent ces derniers temps"""
+        with self._lock:
+            if nom not in self._stats:
+                return False
+            return self._entree(nom)["echecs_recents"] >= seuil
+
+    def latence(self, nom):
+        with self._lock:
+            return self._stats.get(nom, {}).get("latence")
+
+    def resume(self):
+        with self._lock:
+            return {nom: dict(entree) for nom, entree in self._stats.items()}
+
+class RouteurModeles:
+    """Choisit un modèle par question et enchaîne les replis en cas d'erreur.
+
+    La configuration est lue à la première utilisation, pas à l'import ; si
+    data/modeles.json est illisible, les modèles par défaut sont utilisés et
+    l'erreur est conservée dans erreur_config.
+    """
+    def __init__(self, config=None, statistiques=None):
+        self._config = config
+        self.erreur_config = None
+        self.statistiques = statistiques or StatistiquesModeles()
+
+    @property
+    def config(self):
+        if self._config is None:
+            try:
+                self._config = charger_config_modeles()
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                self.erreur_config = e
+                self._config = charger_config_modeles(fichier=None)
+        return self._config
+
+    def chaine_pour(self, question):
+        """Ordre des modèles à essayer pour cette question"""
+        categorie = classer_question(question, self.config["seuil_mots_simple"])
+        chaine = [nom for nom in self.config["chaines"].get(categorie, [])
+                  if nom in self.config["modeles"]]
+
+        def penalite(nom):
+            latence = self.statistiques.latence(nom)
+            cout = self.config["modeles"][nom].get("cout_1k_tokens", 0.0)
+            return (latence if latence is not None else 0.0) * (1 + cout * 1000)
+
+        if categorie == "simple":
+            # Pour les questions simples, le plus rapide/moins cher observé passe devant
+            chaine.sort(key=penalite)
+        # Les modèles en difficulté passent en fin de chaîne (tri stable)
+        chaine.sort(key=self.statistiques.en_difficulte)
+        return chaine
+
+    def appeler_modele(self, nom, question):
+        """Appelle un modèle Together et renvoie la réponse JSON décodée"""
+        import requests
+        profil = self.config["modeles"][nom]
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": profil["model"],
+            "messages": [
+                {"role": "system", "content": PROMPT_SYSTEME},
+                {"role": "user", "content": question}
+            ],
+            "temperature": profil.get("temperature", 0.7),
+            "top_p": profil.get("top_p", 0.9),
+            "max_tokens": profil.get("max_tokens", 512)
+        }
+        response = requests.post(API_URL, headers=headers, json=data,
+                                  timeout=profil.get("timeout", 30))
+        response.raise_for_status()
+        return response.json()
+
+    def repondre_hors_ligne(self, question_norm, prefixe="📴 (hors ligne)",
+                            message_inconnu="📴 Jymie est hors ligne pour le moment et ne connaît pas encore cette question. Réessayez plus tard."):
+        """Repli local : meilleure réponse approchante de la base, même sous le seuil"""
+        question_similaire, _ = meilleure_correspondance(question_norm, connaissances_locales,
+                                                         seuil=self.config["seuil_hors_ligne"])
+        if question_similaire:
+            return f"{prefixe} {connaissances_locales[question_similaire]}"
+        return message_inconnu
+
+    def modele_economique(self):
+        """Nom du modèle configuré le moins cher"""
+        return min(self.config["modeles"],
+                   key=lambda nom: self.config["modeles"][nom].get("cout_1k_tokens", 0.0))
+
+    def repondre(self, question, question_norm, economique=False):
+        """Renvoie (réponse, nom du modèle, usage) ; nom et usage valent None pour le repli local"""
+        import requests
+        chaine = [self.modele_economique()] if economique else self.chaine_pour(question)
+        for nom in chaine:
+            debut = time.perf_counter()
+            try:
+                resultat = self.appeler_modele(nom, question)
+                reponse_ia = resultat["choices"][0]["message"]["content"]
+            except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+                self.statistiques.enregistrer_echec(nom)
+                trace.evenement("http", modele=nom, duree=round(time.perf_counter() - debut, 6),
+                                erreur=type(e).__name__)
+                continue
+            usage = resultat.get("usage") or {}
+            cout = usage.get("total_tokens", 0) / 1000 * self.config["modeles"][nom].get("cout_1k_tokens", 0.0)
+            self.statistiques.enregistrer_succes(nom, time.perf_counter() - debut, cout)
+            trace.evenement("http", modele=nom, duree=round(time.perf_counter() - debut, 6),
+                            tokens=usage.get("total_tokens", 0), caracteres=len(reponse_ia))
+            return reponse_ia, nom, usage
+        return self.repondre_hors_ligne(question_norm), None, None
+
+routeur = RouteurModeles()
+
+# === Comptabilité des tokens et budgets ===
+FICHIER_REGISTRE = os.path.join(DOSSIER_DATA, "registre_tokens.json")
+# Limites facultatives (0 = illimité) et comportement une fois la limite atteinte :
+# "cache" (réponses locales uniquement) ou "economique" (modèle le moins cher)
+BUDGET_TOKENS_JOUR = int(os.getenv("JYMIE_BUDGET_TOKENS_JOUR", "0"))
+BUDGET_TOKENS_SESSION = int(os.getenv("JYMIE_BUDGET_TOKENS_SESSION", "0"))
+BUDGET_MODE = os.getenv("JYMIE_BUDGET_MODE", "cache")
+SEUIL_ALERTE_BUDGET = 0.9
+
+def estimer_tokens(texte):
+    """Estimation grossière (~4 caractères par token) pour les appels évités"""
+    return max(1, len(texte) // 4)
+
+class ComptabiliteTokens:
+    """Tokens consommés et économisés, par session et par jour.
+
+    Le registre quotidien est persisté sous forme compacte :
+    {"AAAA-MM-JJ": {"modeles": {nom: [prompt, completion, appels]}, "economises": [tokens, hits]}}
+    Les appels sont écrits aussitôt ; les économies (chemin rapide du cache) restent
+    en mémoire et ne sont écrites qu'avec l'appel suivant, toutes les
+    ECONOMIES_PAR_ECRITURE réponses locales, ou à la fermeture (vider).
+    """
+    ECONOMIES_PAR_ECRITURE = 20
+
+    def __init__(self, fichier=FICHIER_REGISTRE, budget_jour=BUDGET_TOKENS_JOUR,
+                 budget_session=BUDGET_TOKENS_SESSION, mode=BUDGET_MODE):
+        self.fichier = fichier
+        self.budget_jour = budget_jour
+        self.budget_session = budget_session
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.session = {"modeles": {}, "economises": [0, 0]}
+        self._registre = None
+        self._economies_en_attente = 0
+
+    def _registre_charge(self):
+        if self._registre is None:
+            self._registre = {}
+            if os.path.exists(self.fichier):
+                try:
+                    registre = charger_base(self.fichier)
+                    if not isinstance(registre, dict) or not all(
+                            isinstance(jour, dict) and isinstance(jour.get("modeles"), dict)
+                            and isinstance(jour.get("economises"), list) and len(jour["economises"]) == 2
+                            for jour in registre.values()):
+                        raise ValueError("registre inattendu")
+                    self._registre = registre
+                except (OSError, ValueError):
+                    # Registre tronqué ou corrompu : mis de côté, un nouveau repart de zéro
+                    try:
+                        os.replace(self.fichier, self.fichier + ".illisible")
+                    except OSError:
+                        pass
+        return self._registre
+
+    def _aujourdhui(self):
+        return self._registre_charge().setdefault(time.strftime("%Y-%m-%d"),
+                                                  {"modeles": {}, "economises": [0, 0]})
+
+    def _sauvegarder(self):
+        """Écrit le registre via un fichier temporaire ; un échec n'interrompt jamais une réponse"""
+        debut = time.perf_counter()
+        temporaire = self.fichier + ".tmp"
+        try:
+            with open(temporaire, "w", encoding="utf-8") as f:
+                json.dump(self._registre, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(temporaire, self.fichier)
+        except OSError:
+            # Gardé en mémoire : réécrit à la prochaine occasion ou par vider()
+            self._economies_en_attente = max(self._economies_en_attente, 1)
+            return
+        self._economies_en_attente = 0
+        if trace.actif:
+            trace.evenement("sauvegarde", fichier=os.path.basename(self.fichier),
+                            octets=os.path.getsize(self.fichier), duree=round(time.perf_counter() - debut, 6))
+
+    def enregistrer_appel(self, modele, usage):
+        """Comptabilise l'usage renvoyé par l'API pour un appel réussi"""
+        prompt = usage.get("prompt_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+        with self._lock:
+            for periode in (self.session, self._aujourdhui()):
+                ligne = periode["modeles"].setdefault(modele, [0, 0, 0])
+                ligne[0] += prompt
+                ligne[1] += completion
+                ligne[2] += 1
+            self._sauvegarder()
+
+    def enregistrer_economie(self, question, reponse):
+        """Comptabilise un appel évité grâce à une réponse du cache (score >= SEUIL_CONNU)"""
+        tokens = estimer_tokens(PROMPT_SYSTEME + question) + estimer_tokens(reponse)
+        with self._lock:
+            for periode in (self.session, self._aujourdhui()):
+                periode["economises"][0] += tokens
+                periode["economises"][1] += 1
+            self._economies_en_attente += 1
+            if self._economies_en_attente >= self.ECONOMIES_PAR_ECRITURE:
+                self._sauvegarder()
+
+    def vider(self):
+        """Écrit les économies encore en mémoire"""
+        with self._lock:
+            if self._economies_en_attente:
+                self._sauvegarder()
+
+    @staticmethod
+    def _total(periode):
+        return sum(prompt + completion for prompt, completion, _ in periode["modeles"].values())
 
-connaissances_locales = charger_base()
+    def totaux(self):
+        """(tokens de la session, tokens du jour)"""
+        with self._lock:
+            return self._total(self.session), self._total(self._aujourdhui())
 
-def question_deja_connue(question, base, seuil=70):
-    for q in base:
-        score = fuzz.ratio(question, q)
-        if score >= seuil:
-            return q
-    return None
+    def etat_budget(self):
+        """'ok', 'alerte' (au-delà de 90 % d'une limite) ou 'depasse'"""
+        session, jour = self.totaux()
+        ratio = max(session / self.budget_session if self.budget_session else 0,
+                    jour / self.budget_jour if self.budget_jour else 0)
+        if ratio >= 1:
+            return "depasse"
+        if ratio >= SEUIL_ALERTE_BUDGET:
+            return "alerte"
+        return "ok"
+
+    def mode_budget(self):
+        """None tant que le budget tient, sinon 'cache' ou 'economique'"""
+        return self.mode if self.etat_budget() == "depasse" else None
+
+    def rapport(self):
+        """Résumé lisible de la consommation et des économies"""
+        with self._lock:
+            lignes = []
+            for titre, periode in (("Session", self.session), ("Aujourd'hui", self._aujourdhui())):
+                total = self._total(periode)
+                economises, hits = periode["economises"]
+                lignes.append(f"{titre} : {total} tokens consommés, ~{economises} économisés "
+                              f"({hits} réponses locales)")
+                for modele, (prompt, completion, appels) in sorted(periode["modeles"].items()):
+                    lignes.append(f"    {modele} : {appels} appels, {prompt} + {completion} tokens")
+            for nom, budget in (("session", self.budget_session), ("jour", self.budget_jour)):
+                if budget:
+                    lignes.append(f"Budget {nom} : {budget} tokens (au-delà : mode {self.mode})")
+        return "\n".join(lignes)
+
+comptabilite = ComptabiliteTokens()
+atexit.register(comptabilite.vider)
 
 class APIThread(QThread):
     response_received = pyqtSignal(str)
+    speculative_received = pyqtSignal(str)
     
-    def __init__(self, question):
+    def __init__(self, question, id_trace=None):
         super().__init__()
         self.question = question
+        self.id_trace = id_trace
         
     def run(self):
+        trace.demarrer_requete(self.id_trace)
+        debut = time.perf_counter()
         try:
-            question_norm = self.question.lower().strip()
-            question_similaire = question_deja_connue(question_norm, connaissances_locales)
+            question_norm = normaliser_question(self.question)
+            base_chargee.wait()
+            question_similaire, score = meilleure_correspondance(question_norm, connaissances_locales)
             
-            if question_similaire:
-                response = f"🎯 {connaissances_locales[question_similaire]}"
-                self.response_received.emit(response)
-                return
+            if question_similaire and score >= SEUIL_CONNU:
+                decision = "connue"
+            elif question_similaire:
+                decision = "speculative"
+            else:
+                decision = "inconnue"
+            trace.evenement("recherche", decision=decision, score=round(score, 1),
+                            entrees=len(connaissances_locales), duree=round(time.perf_counter() - debut, 6))
             
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
+            if decision == "connue":
+                reponse_connue = connaissances_locales[question_similaire]
+                comptabilite.enregistrer_economie(self.question, reponse_connue)
+                # Entrées antérieures au cache de rendu : rendues ici, hors du thread graphique
+                rendre_html(reponse_connue, persister=True)
+                trace.evenement("reponse", source="cache", duree=round(time.perf_counter() - debut, 6))
+                self.response_received.emit(f"🎯 {reponse_connue}")
+                return
             
-            data = {
-                "model": "mistralai/Mixtral-8x7B-Instruct-v0.1",
-                "messages": [
-                    {"role": "system", "content": "Tu es Jymie, un assistant IA sophistiqué et élégant qui répond toujours en français avec style et précision."},
-                    {"role": "user", "content": self.question}
-                ],
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "max_tokens": 512
-            }
+            # Presque connue : on montre la réponse locale pendant que l'API travaille
+            if decision == "speculative":
+                self.speculative_received.emit(f"🎯 {connaissances_locales[question_similaire]}")
             
-            response = requests.post("https://api.together.ai/v1/chat/completions", 
-                                   headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            reponse_ia = response.json()["choices"][0]["message"]["content"]
+            mode_budget = comptabilite.mode_budget()
+            if mode_budget == "cache":
+                reponse_ia, modele, usage = routeur.repondre_hors_ligne(
+                    question_norm, prefixe="💰 (budget atteint)",
+                    message_inconnu="💰 Le budget de tokens est atteint et cette question n'est pas encore connue de Jymie."
+                ), None, None
+            else:
+                reponse_ia, modele, usage = routeur.repondre(self.question, question_norm,
+                                                             economique=mode_budget == "economique")
+            if modele is not None:
+                comptabilite.enregistrer_appel(modele, usage)
             
-            connaissances_locales[question_norm] = reponse_ia
-            sauvegarder_base(connaissances_locales)
+            # Les réponses du repli local ne sont pas remises en base, ni rien
+            # tant que le fichier de base est illisible (il serait écrasé)
+            if modele is not None and erreur_base is None:
+                connaissances_locales[question_norm] = reponse_ia
+                sauvegarder_base(connaissances_locales)
+            elif modele is not None:
+                reponse_ia += "\n\n⚠️ Réponse non enregistrée : la base de connaissances est illisible."
+            rendre_html(separer_prefixe(reponse_ia)[1], persister=modele is not None and erreur_base is None)
             
+            trace.evenement("reponse", source=modele or ("budget" if mode_budget == "cache" else "hors_ligne"),
+                            duree=round(time.perf_counter() - debut, 6))
             self.response_received.emit(reponse_ia)
             
         except Exception as e:
+            trace.evenement("reponse", source="erreur", erreur=type(e).__name__,
+                            duree=round(time.perf_counter() - debut, 6))
             self.response_received.emit(f"❌ Une erreur s'est produite : {str(e)}")
 
+class ChargementBaseThread(QThread):
+    """Charge la base de connaissances et la configuration des modèles sans bloquer le premier affichage"""
+    echec = pyqtSignal(str)
+    
+    def run(self):
+        charger_connaissances()
+        routeur.config  # lu ici plutôt qu'à la première question
+        if routeur.erreur_config is not None:
+            self.echec.emit(f"⚠️ Configuration {FICHIER_MODELES} ignorée : {routeur.erreur_config}. "
+                            "Les modèles par défaut sont utilisés.")
+        if erreur_base is not None:
+            self.echec.emit(f"❌ Impossible de lire {FICHIER_BASE} : {erreur_base}. "
+                            "Les nouvelles réponses ne seront pas enregistrées tant que le fichier n'est pas corrigé.")
+        elif erreur_migration is not None:
+            self.echec.emit(f"⚠️ Impossible d'enregistrer {FICHIER_BASE} après la mise à jour de ses clés : "
+                            f"{erreur_migration}. La base reste utilisable ; la mise à jour sera retentée au prochain démarrage.")
+
+# === Animations économes ===
+COULEURS_STATUT = {
+    "en_ligne": ("#00ff88", "En ligne"),
+    "reflexion": ("#00ff88", "Réflexion..."),
+    "hors_ligne": ("#ff6b6b", "Hors ligne"),
+    "budget": ("#ffb347", "Budget presque atteint"),
+    "budget_atteint": ("#ffb347", "Budget atteint")
+}
+
+class HorlogeAnimations(QObject):
+    """Horloge partagée : les animations ne tournent que si leur fenêtre est visible.
+
+    Toutes les QPropertyAnimation avancent déjà sur l'horloge unique de Qt ;
+    ce gestionnaire les met en pause quand la fenêtre est cachée ou réduite,
+    et les relance à son retour. Sans animation active, aucun réveil n'a lieu.
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        super().__init__()
+        self._animations = {}  # fenêtre -> {animation: doit tourner}
+
+    def enregistrer(self, animation, fenetre):
+        if fenetre not in self._animations:
+            self._animations[fenetre] = {}
+            fenetre.installEventFilter(self)
+        self._animations[fenetre][animation] = False
+
+    def _fenetre_visible(self, fenetre):
+        return fenetre.isVisible() and not fenetre.isMinimized()
+
+    def demarrer(self, animation, fenetre):
+        self._animations[fenetre][animation] = True
+        if not self._fenetre_visible(fenetre):
+            return
+        if animation.state() == QAbstractAnimation.State.Paused:
+            animation.resume()
+        elif animation.state() == QAbstractAnimation.State.Stopped:
+            animation.start()
+
+    def arreter(self, animation, fenetre):
+        self._animations[fenetre][animation] = False
+        animation.stop()
+
+    def oublier(self, animation, fenetre):
+        """Arrête une animation et cesse de la suivre (cible sur le point d'être détruite)"""
+        animation.stop()
+        self._animations[fenetre].pop(animation, None)
+
+    def eventFilter(self, obj, event):
+        if obj in self._animations and event.type() in (QEvent.Type.Show, QEvent.Type.Hide,
+                                                         QEvent.Type.WindowStateChange):
+            visible = event.type() != QEvent.Type.Hide and self._fenetre_visible(obj)
+            for animation, doit_tourner in self._animations[obj].items():
+                if not doit_tourner:
+                    continue
+                if visible:
+                    self.demarrer(animation, obj)
+                elif animation.state() == QAbstractAnimation.State.Running:
+                    animation.pause()
+        return False
+
+class IndicateurStatut(QLabel):
+    """Point de statut coloré via la palette (pas de re-analyse de feuille de style)"""
+    def __init__(self, couleur="#00ff88"):
+        super().__init__("●")
+        self._couleur = QColor(couleur)
+        self._appliquer_couleur()
+
+    def _appliquer_couleur(self):
+        palette = self.palette()
+        palette.setColor(QPalette.ColorRole.WindowText, self._couleur)
+        self.setPalette(palette)
+
+    def lire_couleur(self):
+        return self._couleur
+
+    def ecrire_couleur(self, couleur):
+        if couleur != self._couleur:
+            self._couleur = QColor(couleur)
+            self._appliquer_couleur()
+
+    couleur = pyqtProperty(QColor, lire_couleur, ecrire_couleur)
+
+class PointsAnimes(QObject):
+    """Texte suivi de points de suspension animés (indicateur de frappe)"""
+    def __init__(self, label, texte):
+        super().__init__(label)
+        self.label = label
+        self.texte = texte
+        self._etape = 0
+
+    def lire_etape(self):
+        return self._etape
+
+    def ecrire_etape(self, etape):
+        # L'animation interpole en continu ; on ne redessine qu'au changement de point
+        etape = min(etape, 3)
+        if etape != self._etape:
+            self._etape = etape
+            self.label.setText(self.texte + "." * etape)
+
+    etape = pyqtProperty(int, lire_etape, ecrire_etape)
+
+class TexteRendu(QWidget):
+    """Réponse mise en forme ; une mise en page est gardée par tranche de largeur.
+
+    Le HTML n'est lu qu'une fois (document modèle) ; chaque tranche de largeur
+    reçoit un clone déjà mis en page, si bien qu'un redimensionnement ne refait
+    le découpage des lignes qu'en changeant de tranche, et jamais deux fois.
+    La sélection à la souris est gérée par positions dans le texte, communes à
+    tous les clones, via hitTest de la mise en page courante.
+    """
+    PAS_LARGEUR = 40
+    TRANCHES_MAX = 6
+
+    def __init__(self, texte, couleur="#e0e0e0"):
+        super().__init__()
+        self.couleur = QColor(couleur)
+        politique = QSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Preferred)
+        politique.setHeightForWidth(True)
+        self.setSizePolicy(politique)
+        self.setCursor(Qt.CursorShape.IBeamCursor)
+        self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
+        self.setContextMenuPolicy(Qt.ContextMenuPolicy.ActionsContextMenu)
+        action_copier = QAction("Copier", self)
+        action_copier.triggered.connect(self.copier)
+        self.addAction(action_copier)
+        self.setText(texte)
+
+    def text(self):
+        return self._texte
+
+    def setText(self, texte):
+        self._texte = texte
+        prefixe, corps = separer_prefixe(texte)
+        self._modele = QTextDocument()
+        self._modele.setDefaultFont(QFont(*POLICE_REPONSE))
+        self._modele.setDocumentMargin(0)
+        self._modele.setHtml(ENTETE_HTML + rendre_html(corps))
+        if prefixe:
+            QTextCursor(self._modele).insertText(prefixe)
+        self._mises_en_page = OrderedDict()
+        self._ancre = self._position = 0
+        self.updateGeometry()
+        self.update()
+
+    def _curseur_selection(self, document):
+        curseur = QTextCursor(document)
+        curseur.setPosition(self._ancre)
+        curseur.setPosition(self._position, QTextCursor.MoveMode.KeepAnchor)
+        return curseur
+
+    def texte_selectionne(self):
+        # QTextCursor sépare les paragraphes par U+2029
+        return self._curseur_selection(self._modele).selectedText().replace("\u2029", "\n")
+
+    def copier(self):
+        """Copie la sélection, ou toute la réponse s'il n'y en a pas"""
+        QApplication.clipboard().setText(self.texte_selectionne() or self._texte)
+
+    def _position_a(self, point):
+        position = self._document(self.width()).documentLayout().hitTest(point, Qt.HitTestAccuracy.FuzzyHit)
+        return max(0, position)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._ancre = self._position = self._position_a(event.position())
+            self.update()
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.MouseButton.LeftButton:
+            self._position = self._position_a(event.position())
+            self.update()
+
+    def mouseDoubleClickEvent(self, event):
+        curseur = QTextCursor(self._modele)
+        curseur.setPosition(self._position_a(event.position()))
+        curseur.select(QTextCursor.SelectionType.WordUnderCursor)
+        self._ancre, self._position = curseur.anchor(), curseur.position()
+        self.update()
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Copy):
+            self.copier()
+        elif event.matches(QKeySequence.StandardKey.SelectAll):
+            self._ancre, self._position = 0, self._modele.characterCount() - 1
+            self.update()
+        else:
+            super().keyPressEvent(event)
+
+    def _document(self, largeur):
+        tranche = max(self.PAS_LARGEUR, largeur - largeur % self.PAS_LARGEUR)
+        document = self._mises_en_page.get(tranche)
+        if document is None:
+            document = self._modele.clone(self)
+            document.setTextWidth(tranche)
+            self._mises_en_page[tranche] = document
+            if len(self._mises_en_page) > self.TRANCHES_MAX:
+                self._mises_en_page.popitem(last=False)[1].deleteLater()
+        else:
+            self._mises_en_page.move_to_end(tranche)
+        return document
+
+    def hasHeightForWidth(self):
+        return True
+
+    def heightForWidth(self, largeur):
+        return math.ceil(self._document(largeur).size().height())
+
+    def sizeHint(self):
+        document = self._document(560)
+        return QSize(math.ceil(document.idealWidth()), math.ceil(document.size().height()))
+
+    def minimumSizeHint(self):
+        # La hauteur réelle vient de heightForWidth ; éviter une mise en page à 40 px
+        return QSize(self.PAS_LARGEUR, 0)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        contexte = QAbstractTextDocumentLayout.PaintContext()
+        contexte.palette.setColor(QPalette.ColorRole.Text, self.couleur)
+        document = self._document(self.width())
+        if self._ancre != self._position:
+            selection = QAbstractTextDocumentLayout.Selection()
+            selection.cursor = self._curseur_selection(document)
+            format_selection = QTextCharFormat()
+            format_selection.setBackground(self.palette().color(QPalette.ColorRole.Highlight))
+            format_selection.setForeground(self.palette().color(QPalette.ColorRole.HighlightedText))
+            selection.format = format_selection
+            contexte.selections = [selection]
+        document.documentLayout().draw(painter, contexte)
+
 class MessageBubble(QFrame):
     """Bulle de message ultra-moderne avec glassmorphism"""
-    def __init__(self, text, is_user=True):
+    def __init__(self, text, is_user=True, provisoire=False, mise_en_forme=None):
         super().__init__()
         self.setMaximumWidth(600)
         
@@ -111,16 +1022,26 @@ class MessageBubble(QFrame):
         header_layout.addWidget(icon)
         header_layout.addWidget(name)
         header_layout.addStretch()
+        self.name_label = name
         
-        # Message
-        message_label = QLabel(text)
-        message_label.setWordWrap(True)
-        message_label.setFont(QFont("Segoe UI", 11))
-        message_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        # Message : les réponses de Jymie sont rendues en Markdown, le reste en texte brut
+        if mise_en_forme is None:
+            mise_en_forme = not is_user
+        if mise_en_forme:
+            message_label = TexteRendu(text)
+        else:
+            message_label = QLabel(text)
+            message_label.setWordWrap(True)
+            message_label.setFont(QFont(*POLICE_REPONSE))
+            message_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        self.message_label = message_label
         
         layout.addLayout(header_layout)
         layout.addWidget(message_label)
         
+        if provisoire:
+            name.setText("Jymie · réponse provisoire ⏳")
+        
         self.setLayout(layout)
         
         if is_user:
@@ -159,6 +1080,16 @@ class MessageBubble(QFrame):
         shadow.setYOffset(10)
         shadow.setColor(QColor(0, 0, 0, 80))
         self.setGraphicsEffect(shadow)
+    
+    def confirmer(self, text):
+        """Transforme une bulle provisoire en réponse définitive"""
+        if text != self.message_label.text():
+            self.message_label.setText(text)
+        self.name_label.setText("Jymie")
+    
+    def conserver(self):
+        """Garde la réponse provisoire du cache quand l'API n'a rien de mieux à offrir"""
+        self.name_label.setText("Jymie · réponse locale (API indisponible)")
 
 class AboutDialog(QDialog):
     """Fenêtre À propos - Biographie de l'auteur"""
@@ -386,6 +1317,20 @@ class ParametresDialog(QDialog):
         self.theme_combo.setStyleSheet(self.appearance_combo.styleSheet())
         layout.addWidget(self.theme_combo)
         
+        # Consommation de tokens
+        usage_label = QLabel("📊  Consommation de tokens")
+        usage_label.setFont(QFont("Segoe UI", 12, QFont.Weight.Bold))
+        usage_label.setStyleSheet("color: #a0a0ff;")
+        layout.addWidget(usage_label)
+        
+        self.rapport_label = QLabel()
+        self.rapport_label.setFont(QFont("Segoe UI", 10))
+        self.rapport_label.setWordWrap(True)
+        self.rapport_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        self.rapport_label.setStyleSheet("color: rgba(255, 255, 255, 0.8);")
+        layout.addWidget(self.rapport_label)
+        self.actualiser_rapport()
+        
         layout.addStretch()
         
         # Bouton fermer stylé
@@ -414,6 +1359,10 @@ class ParametresDialog(QDialog):
         layout.addWidget(close_btn)
         
         self.setLayout(layout)
+    
+    def actualiser_rapport(self):
+        """Met à jour le résumé de consommation affiché"""
+        self.rapport_label.setText(comptabilite.rapport())
 
 class JymieIA(QMainWindow):
     def __init__(self):
@@ -421,8 +1370,14 @@ class JymieIA(QMainWindow):
         self.setWindowTitle("Jymie IA - L'avenir de l'intelligence artificielle")
         self.setGeometry(100, 50, 1000, 750)
         self.api_thread = None
-        self.typing_timer = QTimer()
-        self.typing_timer.timeout.connect(self.show_typing_indicator)
+        self.message_attente = None
+        self.bulle_provisoire = None
+        self.chargement_thread = None
+        # Dialogues construits à la première ouverture puis réutilisés
+        self.about_dialog = None
+        self.parametres_dialog = None
+        self.horloge = HorlogeAnimations.instance()
+        self.animation_frappe = None
         self.init_ui()
         
     def init_ui(self):
@@ -489,23 +1444,27 @@ class JymieIA(QMainWindow):
         
         # Indicateur de statut animé
         status_container = QHBoxLayout()
-        self.status_indicator = QLabel("●")
+        self.status_indicator = IndicateurStatut()
         self.status_indicator.setFont(QFont("Segoe UI", 16))
-        self.status_indicator.setStyleSheet("color: #00ff88;")
-        status_text = QLabel("En ligne")
-        status_text.setFont(QFont("Segoe UI", 11))
-        status_text.setStyleSheet("color: rgba(255, 255, 255, 0.9);")
+        self.status_text = QLabel("En ligne")
+        self.status_text.setFont(QFont("Segoe UI", 11))
+        self.status_text.setStyleSheet("color: rgba(255, 255, 255, 0.9);")
         status_container.addWidget(self.status_indicator)
-        status_container.addWidget(status_text)
+        status_container.addWidget(self.status_text)
         title_container.addLayout(status_container)
         
         header_layout.addLayout(title_container)
         header.setLayout(header_layout)
         
-        # Animation du statut
-        self.status_timer = QTimer()
-        self.status_timer.timeout.connect(self.animate_status)
-        self.status_timer.start(1000)
+        # Pulsation du statut : uniquement pendant une requête (voir changer_statut)
+        self.animation_statut = QPropertyAnimation(self.status_indicator, b"couleur", self)
+        self.animation_statut.setDuration(1600)
+        self.animation_statut.setStartValue(QColor("#00ff88"))
+        self.animation_statut.setKeyValueAt(0.5, QColor("#00aa55"))
+        self.animation_statut.setEndValue(QColor("#00ff88"))
+        self.animation_statut.setEasingCurve(QEasingCurve.Type.InOutSine)
+        self.animation_statut.setLoopCount(-1)
+        self.horloge.enregistrer(self.animation_statut, self)
         
         main_layout.addWidget(header)
         
@@ -690,17 +1649,22 @@ class JymieIA(QMainWindow):
         
         self.scroll_area = scroll
     
-    def animate_status(self):
-        """Anime l'indicateur de statut"""
-        current = self.status_indicator.styleSheet()
-        if "color: #00ff88" in current:
-            self.status_indicator.setStyleSheet("color: #00cc66;")
+    def changer_statut(self, statut):
+        """Met à jour le statut ; la pulsation ne tourne que pendant la réflexion"""
+        couleur, texte = COULEURS_STATUT[statut]
+        self.status_text.setText(texte)
+        if statut == "reflexion":
+            self.horloge.demarrer(self.animation_statut, self)
         else:
-            self.status_indicator.setStyleSheet("color: #00ff88;")
+            self.horloge.arreter(self.animation_statut, self)
+            self.status_indicator.couleur = QColor(couleur)
     
-    def add_message(self, text, is_user=True):
+    def add_message(self, text, is_user=True, provisoire=False, mise_en_forme=None):
         """Ajoute un message élégant dans le chat"""
-        bubble = MessageBubble(text, is_user)
+        bubble = MessageBubble(text, is_user, provisoire, mise_en_forme)
+        if provisoire:
+            # Mémorisé avant processEvents() : la réponse définitive peut arriver pendant l'appel
+            self.bulle_provisoire = bubble
         
         container = QWidget()
         container.setStyleSheet("background: transparent;")
@@ -721,6 +1685,7 @@ class JymieIA(QMainWindow):
         QTimer.singleShot(50, lambda: self.scroll_area.verticalScrollBar().setValue(
             self.scroll_area.verticalScrollBar().maximum()
         ))
+        return container, bubble
     
     def envoyer_question(self):
         """Envoie une question avec animation"""
@@ -733,28 +1698,90 @@ class JymieIA(QMainWindow):
         self.champ_question.setEnabled(False)
         
         # Ajouter indicateur de réflexion
-        self.add_message("💭 Je réfléchis à votre question...", is_user=False)
-        
-        self.api_thread = APIThread(question)
+        self.message_attente, bulle_attente = self.add_message("💭 Je réfléchis à votre question", is_user=False,
+                                                            mise_en_forme=False)
+        self.bulle_provisoire = None
+        self.demarrer_indicateur_frappe(bulle_attente)
+        self.changer_statut("reflexion")
+        self.charger_base_en_arriere_plan()
+        
+        id_trace = trace.nouvel_identifiant()
+        trace.evenement("question", identifiant=id_trace, question=question)
+        self.api_thread = APIThread(question, id_trace)
+        self.api_thread.speculative_received.connect(self.afficher_reponse_provisoire)
         self.api_thread.response_received.connect(self.afficher_reponse)
         self.api_thread.start()
     
+    def demarrer_indicateur_frappe(self, bulle):
+        """Anime les points de la bulle d'attente tant que la requête est en cours"""
+        points = PointsAnimes(bulle.message_label, bulle.message_label.text())
+        self.animation_frappe = QPropertyAnimation(points, b"etape", points)
+        self.animation_frappe.setDuration(1200)
+        self.animation_frappe.setStartValue(0)
+        self.animation_frappe.setEndValue(4)
+        self.animation_frappe.setLoopCount(-1)
+        self.horloge.enregistrer(self.animation_frappe, self)
+        self.horloge.demarrer(self.animation_frappe, self)
+    
+    def arreter_indicateur_frappe(self):
+        """Arrête l'indicateur de frappe (la bulle est supprimée juste après)"""
+        if self.animation_frappe:
+            self.horloge.oublier(self.animation_frappe, self)
+            self.animation_frappe = None
+    
+    def retirer_message_attente(self):
+        """Supprime l'indicateur de réflexion s'il est encore affiché"""
+        self.arreter_indicateur_frappe()
+        if self.message_attente:
+            self.message_attente.deleteLater()
+            self.message_attente = None
+    
+    def afficher_reponse_provisoire(self, reponse):
+        """Affiche tout de suite une réponse du cache, en attente de confirmation"""
+        self.retirer_message_attente()
+        self.add_message(reponse, is_user=False, provisoire=True)
+    
     def afficher_reponse(self, reponse):
         """Affiche la réponse avec animation"""
-        # Supprimer l'indicateur de réflexion
-        last_widget = self.chat_layout.itemAt(self.chat_layout.count() - 2).widget()
-        if last_widget:
-            last_widget.deleteLater()
-        
-        self.add_message(reponse, is_user=False)
+        if self.bulle_provisoire:
+            # Remplace ou confirme la réponse provisoire sans ajouter de bulle ;
+            # une erreur ou un repli hors ligne ne remplace pas la réponse du cache
+            if reponse.startswith(PREFIXES_DEGRADES):
+                self.bulle_provisoire.conserver()
+            else:
+                self.bulle_provisoire.confirmer(reponse)
+            self.bulle_provisoire = None
+        else:
+            self.retirer_message_attente()
+            self.add_message(reponse, is_user=False)
+        etat_budget = comptabilite.etat_budget()
+        if reponse.startswith("📴"):
+            self.changer_statut("hors_ligne")
+        elif etat_budget == "alerte":
+            self.changer_statut("budget")
+        elif etat_budget == "depasse":
+            self.changer_statut("budget_atteint")
+        else:
+            self.changer_statut("en_ligne")
         self.champ_question.setEnabled(True)
         self.champ_question.setFocus()
     
+    def charger_base_en_arriere_plan(self):
+        """Lance le chargement de la base une fois la fenêtre affichée"""
+        if self.chargement_thread is None and not base_chargee.is_set():
+            self.chargement_thread = ChargementBaseThread()
+            self.chargement_thread.echec.connect(
+                lambda message: self.add_message(message, is_user=False, mise_en_forme=False))
+            self.chargement_thread.start()
+    
     def afficher_parametres(self):
         """Affiche les paramètres"""
-        dialog = ParametresDialog(self)
-        dialog.theme_changed.connect(self.change_background)
-        dialog.exec()
+        if self.parametres_dialog is None:
+            self.parametres_dialog = ParametresDialog(self)
+            self.parametres_dialog.theme_changed.connect(self.change_background)
+        else:
+            self.parametres_dialog.actualiser_rapport()
+        self.parametres_dialog.exec()
     
     def apply_background(self):
         """Applique le fond d'écran actuel"""
@@ -823,18 +1850,17 @@ class JymieIA(QMainWindow):
     
     def afficher_about(self):
         """Affiche la fenêtre À propos"""
-        dialog = AboutDialog(self)
-        dialog.exec()
-    
-    def show_typing_indicator(self):
-        """Animation de frappe"""
-        pass
+        if self.about_dialog is None:
+            self.about_dialog = AboutDialog(self)
+        self.about_dialog.exec()
 
 def main():
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     window = JymieIA()
     window.show()
+    # La base de connaissances est lue après le premier affichage
+    QTimer.singleShot(0, window.charger_base_en_arriere_plan)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
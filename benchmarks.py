@@ -0,0 +1,378 @@
+"""Mesures de performance de Jymie IA.
+
+Usage :
+    python benchmarks.py demarrage [--repetitions N]
+    python benchmarks.py veille [--duree S] [--fenetres N]
+    python benchmarks.py redimensionnement [--reponses N]
+    python benchmarks.py rejouer TRACE.jsonl [--vitesse X] [--base BASE.json] [--sortie REJEU.jsonl]
+
+Les traces sont produites par l'application lancée avec JYMIE_TRACE=chemin.jsonl.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DOSSIER_APP = os.path.dirname(os.path.abspath(__file__))
+
+def environnement_mesure():
+    """Environnement d'un sous-processus : Qt hors écran et clé factice si absente"""
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env.setdefault("TOGETHER_AI_API_KEY", "cle-de-mesure")
+    env["PYTHONPATH"] = DOSSIER_APP + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+# Exécuté dans un processus neuf : temps jusqu'au premier paintEvent de la fenêtre
+SCRIPT_PREMIER_AFFICHAGE = r"""
+import time
+debut = time.perf_counter()
+import app
+from PyQt6.QtCore import QObject, QEvent, QTimer
+from PyQt6.QtWidgets import QApplication
+
+class Guetteur(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            print(f"PREMIER_AFFICHAGE {time.perf_counter() - debut:.6f}")
+            QTimer.singleShot(0, QApplication.instance().quit)
+            obj.removeEventFilter(self)
+        return False
+
+qapp = QApplication([])
+fenetre = app.JymieIA()
+guetteur = Guetteur()
+fenetre.centralWidget().installEventFilter(guetteur)
+fenetre.show()
+QTimer.singleShot(0, fenetre.charger_base_en_arriere_plan)
+QTimer.singleShot(10000, qapp.quit)
+qapp.exec()
+"""
+
+# Exécuté dans un processus neuf : réveils et CPU consommés par des fenêtres inactives
+SCRIPT_VEILLE = r"""
+import sys
+import time
+import app
+from PyQt6.QtCore import QObject, QEvent, QTimer
+from PyQt6.QtWidgets import QApplication
+
+duree, nb_fenetres = float(sys.argv[1]), int(sys.argv[2])
+
+class Compteur(QObject):
+    reveils = 0
+    affichages = 0
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Timer:
+            self.reveils += 1
+        elif event.type() == QEvent.Type.Paint:
+            self.affichages += 1
+        return False
+
+qapp = QApplication([])
+fenetres = [app.JymieIA() for _ in range(nb_fenetres)]
+for fenetre in fenetres:
+    fenetre.show()
+compteur = Compteur()
+
+def commencer():
+    # Laisse passer le premier affichage avant de compter
+    qapp.installEventFilter(compteur)
+    global cpu_debut
+    cpu_debut = time.process_time()
+    QTimer.singleShot(int(duree * 1000), qapp.quit)
+
+QTimer.singleShot(500, commencer)
+qapp.exec()
+cpu = time.process_time() - cpu_debut
+qapp.removeEventFilter(compteur)
+# Le minuteur de fin lui-même compte pour un réveil
+print(f"VEILLE {compteur.reveils - 1} {compteur.affichages} {cpu:.6f}", flush=True)
+"""
+
+# Exécuté dans un processus neuf : coût d'un redimensionnement avec de longues réponses
+SCRIPT_REDIMENSIONNEMENT = r"""
+import sys
+import time
+import app
+from PyQt6.QtWidgets import QApplication
+
+nb_reponses = int(sys.argv[1])
+paragraphe = "Une **longue** réponse avec du `code` et du texte qui se replie. " * 30
+reponse = "## Réponse\n\n" + paragraphe + "\n\n```python\nprint('bonjour')\n```\n\n- point un\n- point deux\n"
+
+qapp = QApplication([])
+fenetre = app.JymieIA()
+fenetre.show()
+debut = time.perf_counter()
+for i in range(nb_reponses):
+    fenetre.add_message(f"{reponse}\n\nRéponse {i}", is_user=False)
+construction = time.perf_counter() - debut
+
+largeurs = list(range(1000, 500, -10)) + list(range(500, 1000, 10))
+debut = time.perf_counter()
+for largeur in largeurs * 2:
+    fenetre.resize(largeur, 750)
+    qapp.processEvents()
+duree = time.perf_counter() - debut
+print(f"REDIMENSIONNEMENT {construction:.6f} {duree / (len(largeurs) * 2):.6f}", flush=True)
+"""
+
+# Exécuté dans un processus neuf : rejoue les questions d'une trace à travers le moteur
+SCRIPT_REJEU = r"""
+import sys
+import json
+import time
+import app
+from PyQt6.QtWidgets import QApplication
+
+chemin_trace, vitesse = sys.argv[1], float(sys.argv[2])
+with open(chemin_trace, encoding="utf-8") as f:
+    questions = [e for e in map(json.loads, f) if e["ev"] == "question"]
+
+qapp = QApplication([])
+app.charger_connaissances()
+debut = time.perf_counter()
+t0 = questions[0]["t"] if questions else 0.0
+for evenement in questions:
+    attente = (evenement["t"] - t0) / vitesse - (time.perf_counter() - debut)
+    if attente > 0:
+        time.sleep(attente)
+    identifiant = app.trace.nouvel_identifiant()
+    app.trace.evenement("question", identifiant=identifiant, question=evenement["question"])
+    # Exécution synchrone : l'interface n'accepte qu'une question à la fois
+    app.APIThread(evenement["question"], identifiant).run()
+"""
+
+def lire_trace(chemin):
+    with open(chemin, encoding="utf-8") as f:
+        return [json.loads(ligne) for ligne in f if ligne.strip()]
+
+def centile(valeurs, p):
+    if not valeurs:
+        return 0.0
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+def resumer_trace(evenements):
+    """Taux de réussite du cache, distribution des latences et écritures disque"""
+    decisions = defaultdict(int)
+    for e in evenements:
+        if e["ev"] == "recherche":
+            decisions[e["decision"]] += 1
+    latences = [e["duree"] for e in evenements if e["ev"] == "reponse"]
+    http = [e for e in evenements if e["ev"] == "http"]
+    sauvegardes = [e for e in evenements if e["ev"] == "sauvegarde"]
+    questions = sum(1 for e in evenements if e["ev"] == "question")
+    return {
+        "questions": questions,
+        "cache": decisions["connue"],
+        "speculatives": decisions["speculative"],
+        "taux_cache": decisions["connue"] / questions if questions else 0.0,
+        "latence_p50": centile(latences, 50),
+        "latence_p95": centile(latences, 95),
+        "appels_http": len(http),
+        "erreurs_http": sum(1 for e in http if "erreur" in e),
+        "sauvegardes": len(sauvegardes),
+        "octets_ecrits": sum(e["octets"] for e in sauvegardes),
+        "duree_sauvegardes": sum((e["duree"] for e in sauvegardes), 0.0)
+    }
+
+def tentatives_par_question(evenements):
+    """Pour chaque question, la file des appels HTTP enregistrés (durée, erreur éventuelle)"""
+    questions = {e["id"]: e["question"] for e in evenements if e["ev"] == "question"}
+    tentatives = defaultdict(deque)
+    for e in evenements:
+        if e["ev"] == "http" and e["id"] in questions:
+            tentatives[questions[e["id"]]].append(e)
+    return tentatives
+
+class ServeurTogetherSimule(ThreadingHTTPServer):
+    """Faux point d'accès /v1/chat/completions qui reproduit latences et erreurs d'une trace"""
+    daemon_threads = True
+
+    def __init__(self, evenements, vitesse):
+        super().__init__(("127.0.0.1", 0), GestionnaireTogetherSimule)
+        self.vitesse = vitesse
+        self.tentatives = tentatives_par_question(evenements)
+        reussites = [e for e in evenements if e["ev"] == "http" and "erreur" not in e]
+        self.defaut = {
+            "duree": statistics.median(e["duree"] for e in reussites) if reussites else 0.5,
+            "tokens": int(statistics.median(e.get("tokens", 0) for e in reussites)) if reussites else 200,
+            "caracteres": int(statistics.median(e.get("caracteres", 0) for e in reussites)) if reussites else 400
+        }
+        self._lock = threading.Lock()
+
+    def prochaine_tentative(self, question):
+        with self._lock:
+            file = self.tentatives.get(question)
+            return file.popleft() if file else self.defaut
+
+class GestionnaireTogetherSimule(BaseHTTPRequestHandler):
+    def do_POST(self):
+        corps = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        question = corps["messages"][-1]["content"]
+        tentative = self.server.prochaine_tentative(question)
+        time.sleep(tentative["duree"] / self.server.vitesse)
+        if "erreur" in tentative:
+            self.send_response(503)
+            self.end_headers()
+            return
+        contenu = f"Réponse simulée à « {question} ». ".ljust(tentative.get("caracteres", 0), "…")
+        tokens = tentative.get("tokens", 0)
+        reponse = json.dumps({
+            "choices": [{"message": {"content": contenu}}],
+            "usage": {"prompt_tokens": tokens // 4, "completion_tokens": tokens - tokens // 4,
+                      "total_tokens": tokens}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reponse)))
+        self.end_headers()
+        self.wfile.write(reponse)
+
+    def log_message(self, *args):
+        pass
+
+def rejouer_trace(chemin_trace, vitesse, base=None, sortie=None):
+    """Rejoue une trace contre le serveur simulé ; renvoie les événements du rejeu"""
+    evenements = lire_trace(chemin_trace)
+    serveur = ServeurTogetherSimule(evenements, vitesse)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    dossier = tempfile.mkdtemp(prefix="jymie-rejeu-")
+    try:
+        os.makedirs(os.path.join(dossier, "data"))
+        if base:
+            shutil.copy(base, os.path.join(dossier, "data", "base_connaissances.json"))
+        chemin_rejeu = os.path.abspath(sortie) if sortie else os.path.join(dossier, "rejeu.jsonl")
+        if os.path.exists(chemin_rejeu):
+            os.remove(chemin_rejeu)
+        env = environnement_mesure()
+        env["JYMIE_API_URL"] = f"http://127.0.0.1:{serveur.server_address[1]}/v1/chat/completions"
+        env["JYMIE_TRACE"] = chemin_rejeu
+        try:
+            subprocess.run([sys.executable, "-c", SCRIPT_REJEU, os.path.abspath(chemin_trace), str(vitesse)],
+                           cwd=dossier, env=env, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError("Rejeu impossible :\n" + e.stderr) from e
+        return lire_trace(chemin_rejeu) if os.path.exists(chemin_rejeu) else []
+    finally:
+        serveur.shutdown()
+        shutil.rmtree(dossier, ignore_errors=True)
+
+def executer_mesure(commande):
+    """Lance une mesure dans un dossier de travail jetable.
+
+    L'application lit et écrit data/ dans le dossier courant : les mesures ne
+    doivent jamais toucher la base de connaissances du développeur.
+    """
+    dossier = tempfile.mkdtemp(prefix="jymie-mesure-")
+    try:
+        return subprocess.run(commande, cwd=dossier, env=environnement_mesure(),
+                              capture_output=True, text=True, check=True)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+def mesurer_importtime():
+    """Temps cumulé d'import du module app selon python -X importtime (secondes)"""
+    resultat = executer_mesure([sys.executable, "-X", "importtime", "-c", "import app"])
+    for ligne in resultat.stderr.splitlines():
+        champs = [c.strip() for c in ligne.split("|")]
+        if len(champs) == 3 and champs[2] == "app":
+            return int(champs[1]) / 1e6
+    raise RuntimeError("Ligne d'import de 'app' introuvable dans la sortie -X importtime")
+
+def mesurer_premier_affichage():
+    """Temps entre le début de l'import et le premier affichage (secondes)"""
+    resultat = executer_mesure([sys.executable, "-c", SCRIPT_PREMIER_AFFICHAGE])
+    correspondance = re.search(r"PREMIER_AFFICHAGE ([0-9.]+)", resultat.stdout)
+    if not correspondance:
+        raise RuntimeError("Aucun affichage détecté :\n" + resultat.stderr)
+    return float(correspondance.group(1))
+
+def mesurer_veille(duree, fenetres):
+    """(réveils minuterie, affichages, secondes CPU) pendant `duree` secondes d'inactivité"""
+    resultat = executer_mesure([sys.executable, "-c", SCRIPT_VEILLE, str(duree), str(fenetres)])
+    correspondance = re.search(r"VEILLE (\d+) (\d+) ([0-9.]+)", resultat.stdout)
+    if not correspondance:
+        raise RuntimeError("Mesure de veille impossible :\n" + resultat.stderr)
+    return int(correspondance.group(1)), int(correspondance.group(2)), float(correspondance.group(3))
+
+def bench_veille(duree, fenetres):
+    reveils, affichages, cpu = mesurer_veille(duree, fenetres)
+    print(f"fenêtres inactives  : {fenetres} pendant {duree:.1f} s")
+    print(f"réveils minuterie   : {reveils} ({reveils / duree:.2f}/s)")
+    print(f"affichages          : {affichages}")
+    print(f"CPU consommé        : {cpu * 1000:.1f} ms")
+
+def mesurer_redimensionnement(reponses):
+    """(secondes de construction, secondes par redimensionnement)"""
+    resultat = executer_mesure([sys.executable, "-c", SCRIPT_REDIMENSIONNEMENT, str(reponses)])
+    correspondance = re.search(r"REDIMENSIONNEMENT ([0-9.]+) ([0-9.]+)", resultat.stdout)
+    if not correspondance:
+        raise RuntimeError("Mesure de redimensionnement impossible :\n" + resultat.stderr)
+    return float(correspondance.group(1)), float(correspondance.group(2))
+
+def bench_redimensionnement(reponses):
+    construction, par_redimensionnement = mesurer_redimensionnement(reponses)
+    print(f"réponses affichées  : {reponses} (construites en {construction * 1000:.0f} ms)")
+    print(f"redimensionnement   : {par_redimensionnement * 1000:.1f} ms par pas")
+
+def bench_rejouer(chemin_trace, vitesse, base, sortie):
+    origine = resumer_trace(lire_trace(chemin_trace))
+    rejeu = resumer_trace(rejouer_trace(chemin_trace, vitesse, base, sortie))
+    print(f"{'':22}{'trace':>12}{'rejeu':>12}")
+    for cle, valeur in origine.items():
+        if isinstance(valeur, float):
+            print(f"{cle:22}{valeur:12.3f}{rejeu[cle]:12.3f}")
+        else:
+            print(f"{cle:22}{valeur:12d}{rejeu[cle]:12d}")
+
+def bench_demarrage(repetitions):
+    imports = [mesurer_importtime() for _ in range(repetitions)]
+    affichages = [mesurer_premier_affichage() for _ in range(repetitions)]
+    print(f"import app          : médiane {statistics.median(imports) * 1000:.1f} ms "
+          f"(min {min(imports) * 1000:.1f} ms)")
+    print(f"premier affichage   : médiane {statistics.median(affichages) * 1000:.1f} ms "
+          f"(min {min(affichages) * 1000:.1f} ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de Jymie IA")
+    sous_commandes = parser.add_subparsers(dest="commande", required=True)
+    demarrage = sous_commandes.add_parser("demarrage", help="import et premier affichage")
+    demarrage.add_argument("--repetitions", type=int, default=5)
+    veille = sous_commandes.add_parser("veille", help="réveils et CPU de fenêtres inactives")
+    veille.add_argument("--duree", type=float, default=10.0)
+    veille.add_argument("--fenetres", type=int, default=5)
+    redimensionnement = sous_commandes.add_parser("redimensionnement",
+                                                  help="redimensionnement avec de longues réponses")
+    redimensionnement.add_argument("--reponses", type=int, default=200)
+    rejouer = sous_commandes.add_parser("rejouer", help="rejoue une trace JYMIE_TRACE contre un faux serveur")
+    rejouer.add_argument("trace")
+    rejouer.add_argument("--vitesse", type=float, default=1.0, help="facteur d'accélération (1 = temps réel)")
+    rejouer.add_argument("--base", help="base de connaissances de départ (vide par défaut)")
+    rejouer.add_argument("--sortie", help="conserver la trace du rejeu dans ce fichier")
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    if args.commande == "demarrage":
+        bench_demarrage(args.repetitions)
+    elif args.commande == "veille":
+        bench_veille(args.duree, args.fenetres)
+    elif args.commande == "redimensionnement":
+        bench_redimensionnement(args.reponses)
+    elif args.commande == "rejouer":
+        bench_rejouer(args.trace, args.vitesse, args.base, args.sortie)
+    print(f"durée totale        : {time.perf_counter() - debut:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import itertools
+
+import pytest
+
+QUESTIONS = [
+    "Quelles sont les classes ?",
+    "Quelles sont leurs classes préférées ?",
+    "Quel est le nom du président ?",
+    "Explique-moi les mouvements des océans 🌊",
+    "Les établissements, les créations et les aménagements",
+    "Pourquoi les chevaux mangent-ils des carottes ???",
+    "leurs",
+    "???",
+    "  Élégance   _et_   précision  ",
+    "C'est quoi l'ÉNERGIE des processus ?",
+]
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    os.environ.setdefault("TOGETHER_AI_API_KEY", "cle-de-test")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # L'import crée data/ dans le dossier courant
+    ancien = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("jymie"))
+    try:
+        import app
+    finally:
+        os.chdir(ancien)
+    return app
+
+@pytest.mark.parametrize("mots_vides, racines", list(itertools.product((False, True), repeat=2)))
+@pytest.mark.parametrize("question", QUESTIONS)
+def test_normalisation_idempotente(app, question, mots_vides, racines):
+    cle = app.normaliser_question(question, mots_vides, racines)
+    assert app.normaliser_question(cle, mots_vides, racines) == cle
+
+@pytest.mark.parametrize("mots_vides, racines", list(itertools.product((False, True), repeat=2)))
+def test_migration_stable(app, mots_vides, racines):
+    base = {question: f"réponse {i}" for i, question in enumerate(QUESTIONS)}
+    base, _ = app.migrer_base(base, mots_vides, racines)
+    _, modifiee = app.migrer_base(base, mots_vides, racines)
+    assert not modifiee